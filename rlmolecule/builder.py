@@ -6,9 +6,9 @@ from functools import partial
 from multiprocessing import Pool
 from typing import Dict, Iterable, List, Optional
 
-import numpy as np
 import ray
 import rdkit
+from lru import LRU
 from rdkit import Chem, RDConfig, RDLogger
 from rdkit.Chem.EnumerateStereoisomers import (
     EnumerateStereoisomers,
@@ -24,6 +24,9 @@ sys.path.append(os.path.join(RDConfig.RDContribDir, "SA_Score"))
 import sascorer  # type: ignore # pylint disable=unresolved-import # noqa=E402
 
 pt = Chem.GetPeriodicTable()
+# Default valences indexed by atomic number (0, the dummy atom, through 118), faster
+# than querying the periodic table by symbol for every atom the builder inspects
+default_valences = [pt.GetDefaultValence(i) for i in range(119)]
 tautomer_enumerator = rdMolStandardize.TautomerEnumerator()
 tautomer_enumerator.SetMaxTautomers(50)
 tautomer_enumerator.SetMaxTransforms(50)
@@ -46,6 +49,7 @@ class MoleculeBuilder:
         sa_score_threshold: Optional[float] = None,
         try_embedding: bool = False,
         cache: bool = False,
+        cache_size: int = int(1e5),
         parallel: bool = False,
         gdb_filter: bool = True,
     ) -> None:
@@ -66,6 +70,8 @@ class MoleculeBuilder:
                 and if this fails, remote it. Defaults to False.
             cache (bool, optional): Whether to cache molecule building for a given
                 SMILES input to speed up subsequent evaluations. Defaults to False.
+            cache_size (int, optional): Maximum number of parent molecules to keep in
+                the (least-recently-used) cache. Defaults to 1e5.
             parallel (bool, optional): (Experimental) whether to try multiprocessing to
                 speed up execution for large molecules. Defaults to False.
             gdb_filter (bool, optional): Whether to apply filters from the gdb17 paper.
@@ -76,16 +82,17 @@ class MoleculeBuilder:
         # MoleculeState, but are not used internally
         self.parallel = parallel
         self.cache = cache
+        self.cache_size = cache_size
         self.max_atoms = max_atoms
         self.min_atoms = min_atoms
         self._using_ray = None
 
         if self.cache:
             if ray.is_initialized():
-                self._builder_cache = get_builder_cache()
+                self._builder_cache = get_builder_cache(cache_size)
                 self._using_ray = True
             else:
-                self._builder_cache = {}
+                self._builder_cache = LRU(cache_size)
                 self._using_ray = False
 
         self.transformation_stack = []
@@ -138,10 +145,24 @@ class MoleculeBuilder:
             inputs = transformer(inputs)
         return list(inputs)
 
-    def __call__(self, parent_molecule: rdkit.Chem.Mol) -> Iterable[rdkit.Chem.Mol]:
+    def __call__(
+        self, parent_molecule: rdkit.Chem.Mol, smiles: Optional[str] = None
+    ) -> Iterable[rdkit.Chem.Mol]:
+        """Build the child molecules of the given parent.
+
+        Args:
+            parent_molecule (rdkit.Chem.Mol): The molecule to build from.
+            smiles (Optional[str], optional): The canonical SMILES of
+                `parent_molecule`, used as the cache key. Saves re-canonicalizing the
+                parent when the caller already has it. Defaults to None.
+
+        Returns:
+            Iterable[rdkit.Chem.Mol]: The child molecules.
+        """
 
         if self.cache:
-            smiles = rdkit.Chem.MolToSmiles(parent_molecule)
+            if smiles is None:
+                smiles = rdkit.Chem.MolToSmiles(parent_molecule)
             try:
                 if self._using_ray:
                     result = ray.get(self._builder_cache.get.remote(smiles))
@@ -166,13 +187,15 @@ class MoleculeBuilder:
             return self.call(parent_molecule)
 
     def __getstate__(self):
-        attributes = self.__dict__
+        attributes = self.__dict__.copy()
         attributes["_builder_cache"] = None
         return attributes
 
     def __setstate__(self, d):
         if d["_using_ray"]:
-            d["_builder_cache"] = get_builder_cache()
+            d["_builder_cache"] = get_builder_cache(d["cache_size"])
+        elif d["cache"]:
+            d["_builder_cache"] = LRU(d["cache_size"])
         self.__dict__ = d
 
 
@@ -207,7 +230,20 @@ class ParallelTransformer(BaseTransformer):
     ):
         self.chunk_size = chunk_size
         self.transformation_stack = transformation_stack
-        self.pool = Pool()
+        self._pool = None
+
+    @property
+    def pool(self) -> Pool:
+        # Started on first use and never pickled, so that builders can be sent to ray
+        # workers, each of which then starts its own pool
+        if self._pool is None:
+            self._pool = Pool()
+        return self._pool
+
+    def __getstate__(self):
+        attributes = self.__dict__.copy()
+        attributes["_pool"] = None
+        return attributes
 
     def __call__(self, inputs: Iterable[rdkit.Chem.Mol]) -> Iterable[rdkit.Chem.Mol]:
         call_fn = partial(process_call, transformation_stack=self.transformation_stack)
@@ -227,12 +263,14 @@ class MoleculeFilter(MoleculeTransformer, ABC):
 
 class UniqueMoleculeFilter(BaseTransformer, ABC):
     def __call__(self, inputs: Iterable[rdkit.Chem.Mol]) -> Iterable[rdkit.Chem.Mol]:
-        self.seen_smiles = set()
+        # Kept local to the generator rather than on the instance, so interleaved or
+        # concurrent calls don't share (or retain) the seen set
+        seen_smiles = set()
         for molecule in inputs:
             smiles = rdkit.Chem.MolToSmiles(molecule)
-            if smiles not in self.seen_smiles:
+            if smiles not in seen_smiles:
+                seen_smiles.add(smiles)
                 yield molecule
-                self.seen_smiles.add(smiles)
 
 
 class AddNewAtomsAndBonds(MoleculeTransformer):
@@ -243,6 +281,11 @@ class AddNewAtomsAndBonds(MoleculeTransformer):
         else:
             self.atom_additions = ("C", "N", "O")
 
+        # A new atom has its full default valence free, which only depends on its type
+        self._addition_valences = [
+            pt.GetDefaultValence(symbol) for symbol in self.atom_additions
+        ]
+
     @staticmethod
     def sanitize(molecule: rdkit.Chem.Mol) -> Optional[rdkit.Chem.Mol]:
         """Sanitize the output molecules, as the RWmols don't have the correct
@@ -258,44 +301,61 @@ class AddNewAtomsAndBonds(MoleculeTransformer):
         return rdkit.Chem.MolFromSmiles(rdkit.Chem.MolToSmiles(molecule))
 
     def call(self, molecule: rdkit.Chem.Mol) -> Iterable[rdkit.Chem.Mol]:
+        # Bonds to symmetry-equivalent atoms give identical products, so drop repeats
+        # before re-parsing them and running the rest of the transformation stack
+        seen_smiles = set()
         for i, atom in enumerate(molecule.GetAtoms()):
+            # The free valence of the starting atom is the same for every partner,
+            # and a saturated atom can't take part in any new bonds
+            free_valence = self._get_free_valence(atom)
+            if free_valence <= 0:
+                continue
+
             for partner in self._get_valid_partners(molecule, atom):
-                for bond_order in self._get_valid_bonds(molecule, i, partner):
+                for bond_order in self._get_valid_bonds(
+                    molecule, free_valence, partner
+                ):
                     rw_mol = self._add_bond(molecule, i, partner, bond_order)
-                    sanitized_mol = self.sanitize(rw_mol)
+                    smiles = rdkit.Chem.MolToSmiles(rw_mol)
+                    if smiles in seen_smiles:
+                        continue
+
+                    seen_smiles.add(smiles)
+                    # Same as self.sanitize(rw_mol), but reusing the SMILES string
+                    sanitized_mol = rdkit.Chem.MolFromSmiles(smiles)
                     if sanitized_mol is not None:
                         yield sanitized_mol
 
     @staticmethod
     def _get_free_valence(atom) -> int:
         """For a given atom, calculate the free valence remaining"""
-        return pt.GetDefaultValence(atom.GetSymbol()) - atom.GetExplicitValence()
+        return default_valences[atom.GetAtomicNum()] - atom.GetExplicitValence()
 
     def _get_valid_partners(
         self, starting_mol: rdkit.Chem.Mol, atom: rdkit.Chem.Atom
     ) -> List[int]:
         """For a given atom, return other atoms it can be connected to"""
-        return list(
-            set(range(starting_mol.GetNumAtoms()))
-            - set((neighbor.GetIdx() for neighbor in atom.GetNeighbors()))
-            - set(range(atom.GetIdx()))
-            - {atom.GetIdx()}  # Prevent duplicates by only bonding forward
-            | set(np.arange(len(self.atom_additions)) + starting_mol.GetNumAtoms())
-        )
+        num_atoms = starting_mol.GetNumAtoms()
+        neighbors = {neighbor.GetIdx() for neighbor in atom.GetNeighbors()}
+        # Prevent duplicates by only bonding forward
+        partners = [
+            idx for idx in range(atom.GetIdx() + 1, num_atoms) if idx not in neighbors
+        ]
+        partners.extend(range(num_atoms, num_atoms + len(self.atom_additions)))
+        return partners
 
     def _get_valid_bonds(
-        self, starting_mol: rdkit.Chem.Mol, atom1_idx: int, atom2_idx: int
+        self, starting_mol: rdkit.Chem.Mol, free_valence_1: int, atom2_idx: int
     ) -> range:
         """Compare free valences of two atoms to calculate valid bonds"""
-        free_valence_1 = self._get_free_valence(starting_mol.GetAtomWithIdx(atom1_idx))
         if atom2_idx < starting_mol.GetNumAtoms():
             free_valence_2 = self._get_free_valence(
-                starting_mol.GetAtomWithIdx(int(atom2_idx))
+                starting_mol.GetAtomWithIdx(atom2_idx)
             )
         else:
-            free_valence_2 = pt.GetDefaultValence(
-                self.atom_additions[atom2_idx - starting_mol.GetNumAtoms()]
-            )
+            free_valence_2 = self._addition_valences[
+                atom2_idx - starting_mol.GetNumAtoms()
+            ]
 
         return range(min(min(free_valence_1, free_valence_2), 3))
 
@@ -342,7 +402,11 @@ class StereoEnumerator(MoleculeTransformer):
         self.opts = StereoEnumerationOptions(unique=True)
 
     def call(self, molecule: rdkit.Chem.Mol) -> Iterable[rdkit.Chem.Mol]:
-        # return EnumerateStereoisomers(molecule, options=self.opts)
+        # Checking for unassigned stereo re-canonicalizes and re-parses every output,
+        # so only do that pass when the result would actually be logged
+        if not logger.isEnabledFor(logging.DEBUG):
+            yield from EnumerateStereoisomers(molecule, options=self.opts)
+            return
 
         smiles_in = rdkit.Chem.MolToSmiles(molecule)
         for out in EnumerateStereoisomers(molecule, options=self.opts):
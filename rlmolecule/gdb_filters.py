@@ -1,20 +1,25 @@
 from collections import Counter
 
-import rdkit
+import rdkit.Chem
 
 # These filters should return 'False' if it passes the criteria
 
+# SMARTS patterns are compiled once here, since the filters run on every candidate
+# molecule the builder produces
+h2_pattern = rdkit.Chem.MolFromSmarts("[R2r3,r4]([R1r3,r4])([R1r3,r4])[R1r3,r4]")
+h3_pattern = rdkit.Chem.MolFromSmarts("[R3]")
+s1_pattern = rdkit.Chem.MolFromSmarts("C=C=C")
+s4_pattern = rdkit.Chem.MolFromSmarts("[R]#[R]")
+
 
 def h2(mol):
     """no atom shared by two small rings"""
-    return mol.HasSubstructMatch(
-        rdkit.Chem.MolFromSmarts("[R2r3,r4]([R1r3,r4])([R1r3,r4])[R1r3,r4]")
-    )
+    return mol.HasSubstructMatch(h2_pattern)
 
 
 def h3(mol):
     """no bridgehead in 3 rings"""
-    return mol.HasSubstructMatch(rdkit.Chem.MolFromSmarts("[R3]"))
+    return mol.HasSubstructMatch(h3_pattern)
 
 
 def h4(mol):
@@ -25,7 +30,7 @@ def h4(mol):
 
 def s1(mol):
     """no allenes"""
-    return mol.HasSubstructMatch(rdkit.Chem.MolFromSmarts("C=C=C"))
+    return mol.HasSubstructMatch(s1_pattern)
 
 
 def s2(mol):
@@ -53,7 +58,7 @@ def s3(mol):
 
 def s4(mol):
     """No triple bonds in ring"""
-    return mol.HasSubstructMatch(rdkit.Chem.MolFromSmarts("[R]#[R]"))
+    return mol.HasSubstructMatch(s4_pattern)
 
 
 def f2(mol):
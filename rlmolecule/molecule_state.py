@@ -78,8 +78,9 @@ class MoleculeState(Vertex):
         """A state implementation which uses simple transformations (such as adding a
         bond) to define a graph of molecules that can be navigated.
 
-        Molecules are stored as rdkit Mol instances, and the rdkit-generated SMILES
-        string is also stored for efficient hashing.
+        Molecules are stored as rdkit Mol instances. The rdkit-generated SMILES string
+        is computed on first access and stored for efficient hashing, since most
+        child states are only ever observed and never need canonicalizing.
 
         Args:
             molecule (Mol): an RDKit molecule specifying the current state
@@ -92,7 +93,7 @@ class MoleculeState(Vertex):
         """
         super().__init__()
         self._molecule: Mol = molecule
-        self._smiles: str = MolToSmiles(self._molecule) if smiles is None else smiles
+        self._smiles: Optional[str] = smiles
         self._forced_terminal: bool = force_terminal
         self.data = data
 
@@ -115,15 +116,20 @@ class MoleculeState(Vertex):
             # makes the Vertex.terminal call evaluate to True
             return []
 
-        next_actions = [self.new(molecule) for molecule in self.builder(self.molecule)]
+        next_actions = [
+            self.new(molecule)
+            for molecule in self.builder(self.molecule, smiles=self.smiles)
+        ]
         next_actions.extend(self._get_terminal_actions())
 
         if self.data.prune_terminal_states:
             next_actions = self._prune_next_actions(next_actions)
 
-        if len(next_actions) >= self.max_num_actions:
+        # Only subsample when there are too many actions; a list that already fits is
+        # returned as-is, keeping the terminal action last
+        if len(next_actions) > self.max_num_actions:
             logger.info(
-                f"{self} has {len(next_actions) + 1} next actions when the "
+                f"{self} has {len(next_actions)} next actions when the "
                 f"maximum is {self.max_num_actions}"
             )
             next_actions = random.sample(next_actions, self.max_num_actions)
@@ -226,6 +232,8 @@ class MoleculeState(Vertex):
 
     @property
     def smiles(self) -> str:
+        if self._smiles is None:
+            self._smiles = MolToSmiles(self._molecule)
         return self._smiles
 
     @property
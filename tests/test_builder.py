@@ -1,3 +1,5 @@
+import pickle
+
 import pytest
 import ray
 import rdkit
@@ -82,6 +84,23 @@ def test_local_cache():
     next_mols_cache = to_smiles(builder(MolFromSmiles("C=CC")))
     assert set(next_mols) == set(next_mols_cache)
 
+    # A known SMILES is used directly as the cache key
+    next_mols_cache = to_smiles(builder(MolFromSmiles("C=CC"), smiles="C=CC"))
+    assert set(next_mols) == set(next_mols_cache)
+
+    # Unpickled builders start with an empty local cache
+    builder = pickle.loads(pickle.dumps(builder))
+    assert "C=CC" not in builder._builder_cache
+    assert set(to_smiles(builder(MolFromSmiles("C=CC")))) == set(next_mols)
+
+
+def test_local_cache_size():
+    builder = MoleculeBuilder(cache=True, cache_size=1)
+    builder(MolFromSmiles("C=CC"))
+    builder(MolFromSmiles("CCC"))
+    assert "C=CC" not in builder._builder_cache
+    assert "CCC" in builder._builder_cache
+
 
 def test_ray_cache(ray_init):
     builder = MoleculeBuilder(cache=True)
@@ -140,6 +159,11 @@ def test_parallel_build():
     smiles = to_smiles((mol for mol in actions))
     assert len(actions) == len(set(smiles))
 
+    # The worker pool isn't pickled, and is restarted on first use after unpickling
+    builder = pickle.loads(pickle.dumps(builder))
+    actions_unpickled = list(builder(rdkit.Chem.MolFromSmiles("CC(=N)C(=O)C(C)C=N")))
+    assert set(to_smiles(actions_unpickled)) == set(smiles)
+
 
 # Just make sure this runs in finite time...
 @pytest.mark.skip
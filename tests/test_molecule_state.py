@@ -26,6 +26,12 @@ def test_root(propane: MoleculeState):
     assert root.smiles == "C"
 
 
+def test_lazy_smiles(propane: MoleculeState):
+    assert propane._smiles is None
+    assert propane.smiles == "CCC"
+    assert propane._smiles == "CCC"
+
+
 def test_next_actions(propane: MoleculeState):
     next_actions = propane.children
     butanes = list(filter(lambda x: x.smiles == "CCCC", next_actions))
@@ -34,6 +40,21 @@ def test_next_actions(propane: MoleculeState):
     assert next_actions[-1].forced_terminal is True
 
 
+def test_max_num_actions(builder: MoleculeBuilder):
+    propane = rdkit.Chem.MolFromSmiles("CCC")
+    data = MoleculeData(builder, max_num_actions=100)
+    num_actions = len(MoleculeState(propane, data).children)
+
+    data = MoleculeData(builder, max_num_actions=num_actions)
+    next_actions = MoleculeState(propane, data).children
+    assert len(next_actions) == num_actions
+    assert next_actions[-1].forced_terminal is True
+
+    data = MoleculeData(builder, max_num_actions=num_actions - 1)
+    next_actions = MoleculeState(propane, data).children
+    assert len(next_actions) == num_actions - 1
+
+
 def test_prune_terminal(builder):
 
     qed_root = QEDState(